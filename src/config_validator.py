@@ -4,12 +4,23 @@ import json
 from typing import Optional, Tuple, List
 from urllib.parse import unquote, urlparse
 
+_BASE64_RE = re.compile(r'^[A-Za-z0-9+/\-_]*$')
+_INTERNED_PROTOCOLS = {p: p for p in ['vmess://', 'vless://', 'ss://', 'trojan://', 'hysteria2://', 'hy2://', 'wireguard://', 'tuic://', 'ssconf://', 'shadowsocks://']}
+
 class ConfigValidator:
+    @staticmethod
+    def get_protocol(config: str) -> str:
+        proto, sep, _ = config.partition('://')
+        if not sep:
+            return ''
+        key = proto.lower() + sep
+        return _INTERNED_PROTOCOLS.get(key, key)
+
     @staticmethod
     def is_base64(s: str) -> bool:
         try:
             s = s.rstrip('=')
-            return bool(re.match(r'^[A-Za-z0-9+/\-_]*$', s))
+            return bool(_BASE64_RE.match(s))
         except:
             return False
 
@@ -174,8 +185,8 @@ class ConfigValidator:
         if not config:
             return False
             
-        protocols = ['vmess://', 'vless://', 'ss://', 'trojan://', 'hysteria2://', 'hy2://', 'wireguard://', 'tuic://', 'ssconf://']
-        return any(config.startswith(p) for p in protocols)
+        protocols = ('vmess://', 'vless://', 'ss://', 'trojan://', 'hysteria2://', 'hy2://', 'wireguard://', 'tuic://', 'ssconf://')
+        return config.startswith(protocols)
 
     @classmethod
     def validate_protocol_config(cls, config: str, protocol: str) -> bool:
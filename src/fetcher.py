@@ -0,0 +1,422 @@
+import re
+import os
+import time
+import socket
+import asyncio
+import logging
+import threading
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Dict, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# پیش‌فرض فرض می‌کنیم این فایل‌ها در کنار اسکریپت هستند
+try:
+    from config_validator import ConfigValidator
+except ImportError:
+    print("Error: config_validator.py not found!")
+    exit(1)
+
+# فقط برای type hint؛ import واقعی config باعث وابستگی چرخشی با اسکریپت config.py می‌شد
+if TYPE_CHECKING:
+    from config import ProxyConfig, ChannelConfig
+
+logger = logging.getLogger(__name__)
+
+# الگوی Regex برای شناسایی پروتکل‌ها (یک بار در زمان بارگذاری ماژول کامپایل می‌شود)
+_PROTOCOL_RE = re.compile(r'(?:vless|vmess|ss|trojan|hy2|hysteria2|tuic|wireguard|shadowsocks)://[^\s<>"\'|]+', re.IGNORECASE)
+# نسخه bytes همین الگو برای جستجوی مستقیم روی response.content (بدون decode کل صفحه)
+_PROTOCOL_RE_B = re.compile(_PROTOCOL_RE.pattern.encode(), re.IGNORECASE)
+# پیش‌بررسی سریع Base64 روی ابتدای متن، قبل از بررسی کامل
+_BASE64_HEAD_RE = re.compile(r'[A-Za-z0-9+/=_-]+')
+_BASE64_HEAD_RE_B = re.compile(rb'[A-Za-z0-9+/=_-]+')
+
+# سقف تعداد Threadهای دانلود؛ تا این سقف همه کانال‌ها همزمان دریافت می‌شوند
+MAX_FETCH_WORKERS = 64
+# از این تعداد صفحه به بعد، پارس HTML در چند Process انجام می‌شود (زیر آن هزینه ساخت Process بیشتر است)
+PARSE_POOL_MIN_PAGES = 32
+
+# selectolax فقط هنگام پارس اولین صفحه تلگرام import می‌شود، نه در زمان بالا آمدن برنامه
+_HTMLParser = None
+
+def _parse_html(html: bytes):
+    global _HTMLParser
+    if _HTMLParser is None:
+        from selectolax.parser import HTMLParser
+        _HTMLParser = HTMLParser
+    return _HTMLParser(html)
+
+# یک Session مشترک در کل برنامه تا Pool اتصال‌ها فقط یک بار گرم شود
+_shared_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_shared_session(headers: Dict[str, str]) -> requests.Session:
+    global _shared_session
+    with _session_lock:
+        if _shared_session is None:
+            session = requests.Session()
+            session.headers.update(headers)
+            session.headers['Connection'] = 'keep-alive'
+            # اندازه Pool برابر با تعداد Threadها تا اتصال TLS بین درخواست‌ها دوباره استفاده شود
+            adapter = HTTPAdapter(pool_connections=MAX_FETCH_WORKERS, pool_maxsize=MAX_FETCH_WORKERS, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _shared_session = session
+        return _shared_session
+
+def _resolve_host(address: Tuple[str, int]):
+    try:
+        socket.getaddrinfo(address[0], address[1], type=socket.SOCK_STREAM)
+    except OSError: pass
+
+def _message_is_fresh(message_node, max_age_days: int) -> bool:
+    """بررسی تاریخ انتشار پیام"""
+    try:
+        time_tag = message_node.css_first('time')
+        if time_tag and time_tag.attributes.get('datetime'):
+            msg_time = datetime.fromisoformat(time_tag.attributes['datetime'].replace('Z', '+00:00'))
+            if datetime.now(timezone.utc) - msg_time > timedelta(days=max_age_days):
+                return False
+    except: pass
+    return True
+
+def _telegram_texts(html: bytes, max_age_days: Optional[int]) -> List[str]:
+    """متن پیام‌های یک صفحه تلگرام؛ اگر max_age_days داده شود فقط پیام‌های تازه"""
+    tree = _parse_html(html)
+    if max_age_days is None:
+        return [t for t in (m.text() for m in tree.css('div.tgme_widget_message_text')) if t]
+
+    # یک پیمایش روی پیام‌ها: اول تاریخ، بعد متن پیام‌های تازه
+    parts = []
+    for message in tree.css('div.tgme_widget_message'):
+        if _message_is_fresh(message, max_age_days):
+            parts.extend(node.text() for node in message.css('div.tgme_widget_message_text'))
+    return parts
+
+def extract_configs_from_text(text: str) -> List[str]:
+    """استخراج تمام کانفیگ‌ها با استفاده از Regex"""
+    # ابتدا بررسی Base64 بودن کل متن (فقط اگر ۱۲۸ کاراکتر اول شبیه Base64 باشد)
+    stripped = text.strip()
+    if _BASE64_HEAD_RE.fullmatch(stripped, 0, 128) and ConfigValidator.is_base64(stripped):
+        decoded = ConfigValidator.decode_base64_text(stripped)
+        if decoded: text = decoded
+
+    # حذف تکراری‌ها همزمان با پیمایش، بدون ساخت لیست میانی از همه نتایج
+    return list(dict.fromkeys(m.group(0) for m in _PROTOCOL_RE.finditer(text)))
+
+def extract_configs_from_bytes(data: bytes) -> List[str]:
+    """مثل extract_configs_from_text ولی مستقیم روی بایت‌های پاسخ (کانفیگ‌ها ASCII و صفحه UTF-8 است)"""
+    stripped = data.strip()
+    if _BASE64_HEAD_RE_B.fullmatch(stripped, 0, 128):
+        # احتمالا کل محتوا Base64 است؛ مسیر متنی کامل
+        return extract_configs_from_text(stripped.decode('utf-8', 'replace'))
+
+    # \s در الگوی bytes فقط فاصله‌های ASCII را می‌شناسد؛ split() فاصله‌های Unicode مثل NBSP را هم جدا می‌کند
+    found = dict.fromkeys(m.group(0) for m in _PROTOCOL_RE_B.finditer(data))
+    return list(dict.fromkeys(raw.decode('utf-8', 'replace').split(None, 1)[0] for raw in found))
+
+def extract_raw_configs(content: bytes, is_telegram: bool, max_age_days: Optional[int] = None) -> List[str]:
+    """استخراج کانفیگ‌های خام از محتوای یک منبع (تابع سطح ماژول تا در ProcessPool قابل اجرا باشد)"""
+    try:
+        # استخراج متن بر اساس نوع منبع
+        if is_telegram:
+            return extract_configs_from_text("\n".join(_telegram_texts(content, max_age_days)))
+        return extract_configs_from_bytes(content)
+    except ImportError:
+        # نبود selectolax نباید مثل یک صفحه خالی بی‌صدا نادیده گرفته شود
+        raise
+    except: return []
+
+class ConfigFetcher:
+    def __init__(self, config: 'ProxyConfig', output_file: Optional[str] = None,
+                 priority: Optional[List[str]] = None, limit: int = 150,
+                 max_age_days: Optional[int] = None):
+        self.config = config
+        self.output_file = output_file or config.OUTPUT_FILE
+        self.limit = limit
+        # فیلتر تاریخ پیام‌های تلگرام (None یعنی بدون فیلتر)
+        self.max_age_days = max_age_days
+        self.validator = ConfigValidator()
+        self.protocol_counts: Dict[str, int] = {p: 0 for p in config.SUPPORTED_PROTOCOLS}
+        self.seen_configs: Set[int] = set()
+        self._seen_lock = threading.Lock()
+        # نگاشت پیشوند پروتکل و نام‌های مستعار آن به پروتکل اصلی (به ترتیب SUPPORTED_PROTOCOLS)
+        self._alias_map: Dict[str, str] = {}
+        for protocol, info in config.SUPPORTED_PROTOCOLS.items():
+            for alias in [protocol] + info.get('aliases', []):
+                self._alias_map.setdefault(alias, protocol)
+        # ترتیب دلخواه پروتکل‌ها؛ اگر داده نشود از priority در SUPPORTED_PROTOCOLS استفاده می‌شود
+        if priority is not None:
+            self._priority_order = [self._alias_map.get(p, p) for p in priority]
+        else:
+            # مرتب‌سازی پروتکل‌ها بر اساس اولویت (Priority) که در config.py تعریف کردی؛ فقط یک بار
+            sorted_protocols = sorted(
+                config.SUPPORTED_PROTOCOLS.items(),
+                key=lambda x: x[1].get("priority", 0),
+                reverse=True
+            )
+            self._priority_order = [proto for proto, info in sorted_protocols]
+        self.session = get_shared_session(config.HEADERS)
+        self._prime_dns()
+
+    def _prime_dns(self):
+        """یک بار resolve کردن هر host قبل از شروع دانلودها تا Threadها به جای N درخواست DNS، از کش resolver سیستم استفاده کنند"""
+        addresses = set()
+        for channel in self.config.get_enabled_channels():
+            try:
+                parts = urlsplit(channel.url)
+                if parts.hostname:
+                    addresses.add((parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)))
+            except ValueError: pass
+        if addresses:
+            with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(addresses))) as executor:
+                list(executor.map(_resolve_host, addresses))
+
+    def _fingerprint(self, config: str) -> int:
+        """اثر انگشت کانفیگ برای حذف موارد تکراری (بدون نام بعد از #)"""
+        try:
+            parts = urlsplit(config)
+            # برای کانفیگ‌های user@host:port فقط پروتکل و netloc مهم است
+            if '@' in parts.netloc:
+                return hash((parts.scheme.lower(), parts.netloc))
+        except ValueError: pass
+        return hash(config.split('#', 1)[0])
+
+    def _mark_seen(self, config: str) -> bool:
+        """ثبت کانفیگ در مجموعه دیده‌شده‌ها؛ برای کانفیگ تکراری False برمی‌گرداند"""
+        fp = self._fingerprint(config)
+        with self._seen_lock:
+            if fp in self.seen_configs: return False
+            self.seen_configs.add(fp)
+        return True
+
+    @staticmethod
+    def _parse_address(config_url: str) -> Optional[Tuple[str, int]]:
+        """استخراج host و port سرور از بخش بعد از @ در کانفیگ"""
+        # اول نام (#) و query حذف می‌شوند تا @ داخل نام کانفیگ (مثل #@MyChannel) اشتباه گرفته نشود
+        url = config_url.partition('#')[0].partition('?')[0]
+        _, at, host_part = url.rpartition('@')
+        if not at: return None
+        host, _, port = host_part.partition('/')[0].rpartition(':')
+        host = host.strip('[]')
+        try:
+            port_num = int(port)
+        except ValueError:
+            return None
+        if not host or not 0 < port_num < 65536: return None
+        return host, port_num
+
+    def is_alive(self, config_url: str, timeout: float = 1.0) -> bool:
+        """یک تست اتصال سریع (TCP Ping) برای اطمینان از زنده بودن سرور"""
+        address = self._parse_address(config_url)
+        if address is None: return False
+        try:
+            # create_connection خانواده آدرس (IPv4/IPv6) را از getaddrinfo انتخاب می‌کند؛
+            # timeout فقط اتصال را محدود می‌کند، نه resolve کردن نام host
+            with socket.create_connection(address, timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def filter_alive(self, configs: List[str], timeout: float = 1.0, concurrency: int = 500) -> List[str]:
+        """TCP Ping همزمان برای یک دسته کانفیگ؛ به جای N×timeout در حدود یک timeout تمام می‌شود"""
+        async def probe(config_url: str, limit: asyncio.Semaphore) -> bool:
+            address = self._parse_address(config_url)
+            if address is None: return False
+            async with limit:
+                try:
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout)
+                except (OSError, asyncio.TimeoutError):
+                    return False
+                writer.close()
+                return True
+
+        async def probe_all() -> List[bool]:
+            limit = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(probe(c, limit) for c in configs))
+
+        results = asyncio.run(probe_all())
+        return [c for c, alive in zip(configs, results) if alive]
+
+    def fetch_with_retry(self, url: str) -> Optional[requests.Response]:
+        backoff = 1
+        for attempt in range(self.config.MAX_RETRIES):
+            try:
+                response = self.session.get(url, timeout=self.config.REQUEST_TIMEOUT)
+                response.raise_for_status()
+                return response
+            except requests.RequestException as e:
+                wait_time = min(self.config.RETRY_DELAY * backoff, 30)
+                time.sleep(wait_time)
+                backoff *= 2
+        return None
+
+    def extract_configs_from_text(self, text: str) -> List[str]:
+        return extract_configs_from_text(text)
+
+    def process_single_config(self, raw_config: str, channel: 'ChannelConfig') -> Optional[str]:
+        """پردازش و ولیدیشن یک کانفیگ واحد"""
+        try:
+            config = raw_config.strip()
+            # نرمال‌سازی Hysteria2
+            if config.startswith('hy2://'):
+                config = self.validator.normalize_hysteria2_protocol(config)
+
+            protocol = self._alias_map.get(self.validator.get_protocol(config))
+            if protocol is None: return None
+            if not self.config.is_protocol_enabled(protocol): return None
+
+            if protocol == "vmess://":
+                config = self.validator.clean_vmess_config(config)
+
+            clean_config = self.validator.clean_config(config)
+            if self.validator.validate_protocol_config(clean_config, protocol):
+                return clean_config
+            return None
+        except:
+            return None
+
+    def download_channel(self, channel: 'ChannelConfig') -> Optional[Tuple[bytes, float]]:
+        """فقط دریافت محتوای منبع (بخش I/O)؛ خروجی: بایت‌های پاسخ و زمان پاسخ، یا None در صورت خطا"""
+        start_time = time.time()
+
+        response = self.fetch_with_retry(channel.url)
+        if not response: return None
+        # response.content بدون تشخیص encoding و ساخت یک کپی str از کل صفحه
+        return response.content, time.time() - start_time
+
+    def validate_channel_configs(self, channel: 'ChannelConfig', raw_found: List[str]) -> List[str]:
+        """فقط ولیدیشن کانفیگ‌های خام یک کانال؛ بدون حذف تکراری و آمار، پس ترتیب اجرا مهم نیست"""
+        configs: List[str] = []
+        for raw in raw_found:
+            processed = self.process_single_config(raw, channel)
+            if processed: configs.append(processed)
+        return configs
+
+    def record_channel_configs(self, channel: 'ChannelConfig', raw_count: int, validated: List[str], response_time: float) -> List[str]:
+        """حذف تکراری‌ها و ثبت آمار یک کانال؛ باید به ترتیب کانال‌ها صدا زده شود"""
+        configs: List[str] = []
+        channel.metrics.total_configs = raw_count
+
+        for processed in validated:
+            if self._mark_seen(processed):
+                configs.append(processed)
+                # آپدیت آمار پروتکل
+                p_type = self.validator.get_protocol(processed)
+                channel.metrics.protocol_counts[p_type] = channel.metrics.protocol_counts.get(p_type, 0) + 1
+
+        self.config.update_channel_stats(channel, True, response_time)
+        logger.info(f"Fetched {len(configs)} configs from {channel.url}")
+        return configs
+
+    def fetch_configs_from_source(self, channel: 'ChannelConfig') -> List[str]:
+        """استخراج کامل برای یک کانال (دریافت، پارس و پردازش)"""
+        if not channel.enabled: return []
+        downloaded = self.download_channel(channel)
+        if downloaded is None:
+            self.config.update_channel_stats(channel, False)
+            return []
+        content, response_time = downloaded
+        raw_found = extract_raw_configs(content, channel.is_telegram, self.max_age_days)
+        validated = self.validate_channel_configs(channel, raw_found)
+        return self.record_channel_configs(channel, len(raw_found), validated, response_time)
+
+    def fetch_all_configs(self) -> List[str]:
+        enabled_channels = self.config.get_enabled_channels()
+        all_configs = []
+
+        logger.info(f"Starting concurrent fetch from {len(enabled_channels)} channels...")
+
+        # استفاده از Multi-threading برای سرعت حداکثری (فقط I/O)
+        workers = max(1, min(MAX_FETCH_WORKERS, len(enabled_channels)))
+        # پارس (CPU) در Processها تا GIL گلوگاه نشود؛ فقط وقتی تعداد منابع زیاد است
+        use_parse_pool = len(enabled_channels) >= PARSE_POOL_MIN_PAGES
+        # اندیس کانال -> (تعداد کانفیگ خام، کانفیگ‌های معتبر، زمان پاسخ) یا None برای کانال ناموفق
+        outcomes: Dict[int, Optional[Tuple[int, List[str], float]]] = {}
+        downloaded: Dict[int, Tuple[bytes, float]] = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            downloads = {executor.submit(self.download_channel, ch): i for i, ch in enumerate(enabled_channels)}
+            # بدون Process pool هر کانال به محض رسیدن پاسخش پارس و ولیدیت می‌شود، همزمان با دانلود کانال‌های کندتر
+            for future in as_completed(downloads):
+                i = downloads[future]
+                channel = enabled_channels[i]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Fetch error for {channel.url}: {e}")
+                    result = None
+                if result is None:
+                    outcomes[i] = None
+                    continue
+
+                if use_parse_pool:
+                    downloaded[i] = result
+                else:
+                    content, response_time = result
+                    raw_found = extract_raw_configs(content, channel.is_telegram, self.max_age_days)
+                    outcomes[i] = (len(raw_found), self.validate_channel_configs(channel, raw_found), response_time)
+
+        if downloaded:
+            # Processها با spawn ساخته می‌شوند نه fork؛ fork در حضور threadهای زنده (مثل listener لاگ) ممکن است deadlock کند
+            with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as parse_pool:
+                parses = {
+                    parse_pool.submit(extract_raw_configs, content, enabled_channels[i].is_telegram, self.max_age_days): (i, response_time)
+                    for i, (content, response_time) in downloaded.items()
+                }
+                for future in as_completed(parses):
+                    i, response_time = parses[future]
+                    raw_found = future.result()
+                    outcomes[i] = (len(raw_found), self.validate_channel_configs(enabled_channels[i], raw_found), response_time)
+
+        # حذف تکراری‌ها و آمار به ترتیب کانال‌ها، مستقل از ترتیب رسیدن پاسخ‌ها
+        for i in sorted(outcomes):
+            outcome = outcomes[i]
+            if outcome is None:
+                self.config.update_channel_stats(enabled_channels[i], False)
+                continue
+            all_configs.extend(self.record_channel_configs(enabled_channels[i], *outcome))
+
+        if all_configs:
+            balanced = self.balance_protocols(all_configs)
+            # آپدیت شمارنده نهایی برای لاگ
+            for c in balanced:
+                p = self.validator.get_protocol(c)
+                if p in self.protocol_counts: self.protocol_counts[p] += 1
+            return balanced
+        return []
+
+    def balance_protocols(self, configs: List[str]) -> List[str]:
+        """انتخاب کانفیگ‌های برتر (حداکثر limit عدد) بر اساس اولویت پروتکل"""
+        # دسته‌بندی کانفیگ‌ها با یک جستجوی دیکشنری (نام‌های مستعار مثل hy2 به پروتکل اصلی نگاشت می‌شوند)
+        proto_map = {p: [] for p in self.config.SUPPORTED_PROTOCOLS}
+        for c in configs:
+            bucket = proto_map.get(self._alias_map.get(self.validator.get_protocol(c)))
+            if bucket is not None:
+                bucket.append(c)
+
+        final_selection = []
+        # جمع‌آوری از پروتکل‌های با اولویت بالا تا رسیدن به limit
+        for proto in self._priority_order:
+            final_selection.extend(proto_map.get(proto, ()))
+
+            if len(final_selection) >= self.limit:
+                break
+
+        # برگرداندن دقیقاً limit مورد اول (یا کمتر اگر کل موجودی کمتر بود)
+        return final_selection[:self.limit]
+
+    def save_configs(self, configs: List[str], header: str):
+        try:
+            os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+            data = (header + "\n\n".join(configs)).encode('utf-8')
+            # نوشتن در فایل موقت و جایگزینی اتمی تا لینک سابسکریپشن هیچ‌وقت فایل نیمه‌کاره نبیند
+            tmp_file = self.output_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self.output_file)
+            logger.info(f"Saved {len(configs)} configs to {self.output_file}")
+        except Exception as e:
+            logger.error(f"Save error: {e}")